@@ -3,16 +3,14 @@ from __future__ import absolute_import, division, print_function
 from collections import OrderedDict, defaultdict
 
 import numpy as np
-import pandas as pd
-import seaborn
 from matplotlib import pyplot as plt
-from scipy.stats import kde
+from scipy import ndimage
 from six import string_types
 from sklearn.neighbors import KernelDensity
 
 from odin import backend as K
 from odin import visual
-from odin.utils import as_tuple, cache_memory, catch_warnings_ignore
+from odin.utils import as_tuple, cache_memory
 from odin.visual import plot_figure, to_axis
 from sisua.data import get_dataset
 from sisua.data.const import MARKER_ADT_GENE
@@ -135,28 +133,35 @@ def plot_imputation_series(original, imputed, title="Imputation"):
   imputed = K.log_norm(imputed, axis=0)
   max_val = max(np.max(original), np.max(imputed))
 
-  with catch_warnings_ignore(FutureWarning):
-    grid = seaborn.pairplot(data=pd.DataFrame({
-        'Original Value': original,
-        'Imputed Value': imputed
-    }),
-                            height=4,
-                            aspect=1,
-                            kind='reg',
-                            diag_kws={'bins': 180},
-                            plot_kws={
-                                'scatter_kws': dict(s=2, alpha=0.6),
-                                'line_kws': dict(color='red', alpha=0.8),
-                                'color': 'g'
-                            })
-    ids = np.linspace(0, max_val)
-    grid.axes[0, 1].set_xlim((0, max_val))
-    grid.axes[0, 1].set_ylim((0, max_val))
-    grid.axes[0, 1].plot(ids, ids, linestyle='--', linewidth=1, color='black')
-
-    grid.axes[1, 0].set_xlim((0, max_val))
-    grid.axes[1, 0].set_ylim((0, max_val))
-    grid.axes[1, 0].plot(ids, ids, linestyle='--', linewidth=1, color='black')
+  # same layout as `seaborn.pairplot(kind='reg')` but drawn directly with
+  # matplotlib: histograms on the diagonal, hexbin density and linear fit
+  # off the diagonal
+  names = ('Original Value', 'Imputed Value')
+  values = (np.ravel(original), np.ravel(imputed))
+  ids = np.linspace(0, max_val)
+  _, axes = plt.subplots(nrows=2, ncols=2, figsize=(8, 8))
+  for i, (y_name, y) in enumerate(zip(names, values)):
+    for j, (x_name, x) in enumerate(zip(names, values)):
+      ax = axes[i, j]
+      if i == j:
+        ax.hist(x, bins=180, color='g')
+      else:
+        ax.hexbin(x,
+                  y,
+                  gridsize=80,
+                  cmap='Greens',
+                  mincnt=1,
+                  extent=(0, max_val, 0, max_val))
+        slope, intercept = np.polyfit(x, y, deg=1)
+        ax.plot(ids, slope * ids + intercept, color='red', alpha=0.8)
+        ax.plot(ids, ids, linestyle='--', linewidth=1, color='black')
+        ax.set_xlim((0, max_val))
+        ax.set_ylim((0, max_val))
+      if i == 1:
+        ax.set_xlabel(x_name)
+      if j == 0:
+        ax.set_ylabel(y_name)
+  plt.tight_layout()
 
 
 def plot_imputation(original,
@@ -209,9 +214,18 @@ def plot_imputation(original,
 
   # Evaluate a gaussian kde on a regular grid of nbins x nbins over data extents
   xi, yi = np.mgrid[0:ymax:nbins * 1j, 0:ymax:nbins * 1j]
-  # ====== scipy ====== #
-  k_ = kde.gaussian_kde(data)
-  zi = k_(np.vstack([xi.flatten(), yi.flatten()]))
+  # ====== binned kde ====== #
+  # 2D histogram smoothed by a gaussian filter with the Scott's bandwidth of
+  # `scipy.stats.gaussian_kde`, i.e. linear in the number of points instead
+  # of evaluating every point at every grid cell
+  bin_width = ymax / (nbins - 1)
+  zi, _, _ = np.histogram2d(x,
+                            y,
+                            bins=nbins,
+                            range=[[-bin_width / 2, ymax + bin_width / 2]] * 2,
+                            density=True)
+  bandwidth = np.std(data, axis=1, ddof=1) * data.shape[1]**(-1. / 6.)
+  zi = ndimage.gaussian_filter(zi, sigma=bandwidth / bin_width, mode='constant')
   # ====== sklearn ====== #
   # k_ = KernelDensity(kernel=str(kde_kernel))
   # k_.fit(data.T)
@@ -224,7 +238,9 @@ def plot_imputation(original,
 
   plt.pcolormesh(yi, xi, zi.reshape(xi.shape), cmap="Reds")
 
-  a, _, _, _ = np.linalg.lstsq(y[:, np.newaxis], x, rcond=-1)
+  # closed form of the least squares slope without intercept
+  yy = np.dot(y, y)
+  a = np.dot(y, x) / yy if yy > 0 else 0.
   linspace = np.linspace(0, ymax)
   plt.plot(linspace, a * linspace, color='black')
 
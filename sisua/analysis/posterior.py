@@ -231,7 +231,7 @@ class Posterior(Visualizer):
       om_new = OMIC.parse(f'i{om}')
       # prepare the new data
       if isinstance(data, tfd.Distribution):
-        data = data.mean().numpy()
+        data = data.mean().numpy().astype(np.float32, copy=False)
         if data.ndim == 3:
           data = np.mean(data, axis=0)
       # find the variable's names
@@ -806,7 +806,7 @@ class Posterior(Visualizer):
     ### plotting
     ncol = 5
     X = self.dataset.get_omic(omic=factor_omic)
-    Z = self.latents.mean().numpy()
+    Z = self.latents.mean().numpy().astype(np.float32, copy=False)
     latent_names = self.dataset.get_var_names(OMIC.latent)
     norm = lambda x: (x - np.min(x)) / (np.max(x) - np.min(x))
     for (name1, name2), pairs in omic2latent.items():
@@ -983,7 +983,8 @@ class Posterior(Visualizer):
     omic = self.sco_original.omics[0].name
     X_org = self.omics_data[(omic, 'original')]
     X_crr = self.omics_data[(omic, 'corrupted')]
-    imputed = self.omics_data[(omic, 'imputed')].mean().numpy()
+    imputed = self.omics_data[(omic, 'imputed')].mean().numpy().astype(
+        np.float32, copy=False)
     if imputed.ndim > 2:
       imputed = np.mean(imputed, axis=0)
     return {
@@ -27,9 +27,9 @@ from odin.utils import (IndexedList, MD5object, as_tuple, batching,
                         cache_memory, catch_warnings_ignore, ctext,
                         is_primitive)
 from sisua.data.const import MARKER_GENES, OMIC
-from sisua.data.utils import (apply_artificial_corruption, get_library_size,
-                              is_binary_dtype, is_categorical_dtype,
-                              standardize_protein_name)
+from sisua.data.utils import (apply_artificial_corruption, cached_argspec,
+                              get_library_size, is_binary_dtype,
+                              is_categorical_dtype, standardize_protein_name)
 from sisua.label_threshold import ProbabilisticEmbedding
 
 # Heuristic constants
@@ -172,7 +172,7 @@ class _OMICbase(sc.AnnData, MD5object):
 
   def _record(self, name: str, local: dict):
     method = getattr(self, name)
-    specs = inspect.getfullargspec(method)
+    specs = cached_argspec(method)
     assert inspect.ismethod(method)
     local = {
         k: v if is_primitive(v, inc_ndarray=False) else str(type(v)) \
@@ -544,6 +544,8 @@ class _OMICbase(sc.AnnData, MD5object):
                      shuffle=1000,
                      cache='',
                      framework='tensorflow',
+                     log_norm=False,
+                     library=True,
                      seed=1) -> tf.data.Dataset:
     r""" Create dataset for training using one or multiple OMIC data
 
@@ -554,6 +556,10 @@ class _OMICbase(sc.AnnData, MD5object):
         var will be include, the length of the list is coordinated to the `omics`
       labels_percent : a Scalar [0., 1.]. If > 0, create a mask with given
         percent set to True.
+      log_norm : a Boolean. If True, include `log_inputs` which is `log1p` of
+        the first OMIC, computed before caching so it is done only once.
+      library : a Boolean. If False, the library size is neither computed nor
+        included in the dataset.
     """
     if omics is None:
       omics = self.current_omic
@@ -565,12 +571,13 @@ class _OMICbase(sc.AnnData, MD5object):
     omics = [OMIC.parse(o) for o in tf.nest.flatten(omics)]
     inputs = [self.get_omic(o) for o in omics]
     # library size
-    library = []
-    for o in omics:
-      library.append(np.concatenate(self.get_library_size(o), axis=-1))
+    library_size = []
+    if library:
+      for o in omics:
+        library_size.append(np.concatenate(self.get_library_size(o), axis=-1))
     # create the dataset
     ds = [tf.data.Dataset.from_tensor_slices(i) for i in inputs] + \
-      [tf.data.Dataset.from_tensor_slices(i) for i in library]
+      [tf.data.Dataset.from_tensor_slices(i) for i in library_size]
     if len(ds) > 0:
       ds = tf.data.Dataset.zip(tuple(ds))
     # for labels_percent
@@ -585,10 +592,13 @@ class _OMICbase(sc.AnnData, MD5object):
       else:
         mask = gen.uniform(shape=(1,)) < labels_percent
       inputs = data[:len(omics)]
-      library = data[len(omics):]
-      return dict(inputs=inputs[0] if len(inputs) == 1 else inputs,
-                  library=library[0] if len(library) == 1 else library,
-                  mask=mask)
+      lib = data[len(omics):]
+      data = dict(inputs=inputs[0] if len(inputs) == 1 else inputs, mask=mask)
+      if library:
+        data['library'] = lib[0] if len(lib) == 1 else lib
+      if log_norm:
+        data['log_inputs'] = tf.math.log1p(inputs[0])
+      return data
 
     ds = ds.map(masking, tf.data.experimental.AUTOTUNE)
     # post processing
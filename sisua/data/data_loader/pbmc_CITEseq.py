@@ -1,19 +1,23 @@
 import base64
+import csv
+import mmap
 import os
 import pickle
 import shutil
+import struct
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from io import BytesIO
 
 import numpy as np
+import pandas as pd
 
-from odin.fuel import Dataset
 from odin.utils import batching, select_path
-from odin.utils.crypto import decrypt_aes, md5_checksum
 from sisua.data.path import DATA_DIR, DOWNLOAD_DIR
 from sisua.data.single_cell_dataset import SingleCellOMIC
-from sisua.data.utils import (download_file, remove_allzeros_columns,
-                              save_to_dataset)
+from sisua.data.utils import decrypt_aes_stream, download_file
 
 # ===========================================================================
 # Const
@@ -39,13 +43,181 @@ _5000_PBMC_PREPROCESSED = select_path(os.path.join(
 
 _PASSWORD = 'uef-czi'
 
+# saved in this order, the last file marks a complete cache
+_ARRAYS = ('X', 'y', 'X_row', 'X_col', 'y_col')
+
 
 # ===========================================================================
-# Main
+# Helpers
 # ===========================================================================
-def read_CITEseq_PBMC(override=False,
-                      verbose=True,
-                      filtered_genes=False) -> SingleCellOMIC:
+def _npy_shape(path):
+  r""" Return the shape stored in the header of a `.npy` file, or `None` if
+  the file is missing or truncated, only the header bytes are read. """
+  if not os.path.exists(path):
+    return None
+  read_header = {
+      (1, 0): np.lib.format.read_array_header_1_0,
+      (2, 0): np.lib.format.read_array_header_2_0,
+  }
+  with open(path, 'rb') as f:
+    try:
+      version = np.lib.format.read_magic(f)
+      if version not in read_header:
+        return None
+      shape, _, dtype = read_header[version](f)
+    except ValueError:  # truncated header
+      return None
+    offset = f.tell()
+  if os.path.getsize(path) != offset + int(np.prod(shape)) * dtype.itemsize:
+    return None
+  return shape
+
+
+def _is_preprocessed(path):
+  r""" Quick validation of the preprocessed cache without hashing the data """
+  shapes = [_npy_shape(os.path.join(path, f'{name}.npy')) for name in _ARRAYS]
+  if any(s is None for s in shapes):
+    return False
+  X, y, X_row, X_col, y_col = shapes
+  return (X[0] == y[0] == X_row[0] and X[1] == X_col[0] and y[1] == y_col[0])
+
+
+def _read_counts(data, chunksize=1024):
+  r""" Parse a count matrix csv stored as [n_features, n_cells], the values are
+  filled chunk by chunk into a preallocated [n_cells, n_features] float32
+  array so no transposed copy is needed afterwards. The raw bytes are given
+  to the C parser which converts the numbers directly into float32 (the
+  column types are given from the header line and the NA detection is
+  disabled), only the ids become python strings. The total count of each
+  feature is accumulated while its block is still in cache, so filtering
+  the features does not need another pass over the matrix. The
+  multi-threaded reader of `pyarrow` is used instead if it is installed.
+
+  Return:
+    cell_id : [n_cells]
+    feature_id : [n_features]
+    counts : [n_cells, n_features]
+    totals : [n_features]
+  """
+  header = next(csv.reader([str(data[:data.find(b'\n')], 'ascii')]))
+  try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+  except ImportError:
+    pa = None
+  if pa is not None:
+    return _read_counts_arrow(data, header, pa, pa_csv)
+  # upper bound on the number of features (the header line is excluded)
+  n_features = data.count(b'\n') + (0 if data.endswith(b'\n') else 1) - 1
+  counts = None
+  feature_id = np.empty(shape=(n_features,), dtype=object)
+  totals = np.empty(shape=(n_features,), dtype=np.float64)
+  start = 0
+  for chunk in pd.read_csv(BytesIO(data),
+                           header=0,
+                           index_col=0,
+                           dtype={name: np.float32 for name in header[1:]},
+                           na_filter=False,
+                           encoding='ascii',
+                           engine='c',
+                           chunksize=chunksize):
+    if counts is None:
+      cell_id = chunk.columns.to_numpy().astype(str)
+      counts = np.empty(shape=(chunk.shape[1], n_features), dtype=np.float32)
+    end = start + chunk.shape[0]
+    values = chunk.to_numpy(dtype=np.float32)
+    counts[:, start:end] = values.T
+    totals[start:end] = np.sum(values, axis=1, dtype=np.float64)
+    feature_id[start:end] = chunk.index
+    start = end
+  if start < n_features:  # blank lines were skipped
+    counts = np.ascontiguousarray(counts[:, :start])
+  return cell_id, feature_id[:start].astype(str), counts, totals[:start]
+
+
+def _read_counts_arrow(data, header, pa, pa_csv):
+  r""" Same as `_read_counts` but using the multi-threaded csv reader of
+  `pyarrow`, every column of the table is a cell which is copied into one
+  row of the [n_cells, n_features] array. """
+  table = pa_csv.read_csv(
+      pa.py_buffer(data),
+      convert_options=pa_csv.ConvertOptions(
+          column_types={name: pa.float32() for name in header[1:]}))
+  feature_id = table.column(0).to_numpy(zero_copy_only=False).astype(str)
+  cell_id = np.asarray(table.column_names[1:]).astype(str)
+  counts = np.empty(shape=(len(cell_id), len(feature_id)), dtype=np.float32)
+  totals = np.zeros(shape=(len(feature_id),), dtype=np.float64)
+  for i in range(len(cell_id)):
+    counts[i] = table.column(i + 1).to_numpy()
+    totals += counts[i]
+  return cell_id, feature_id, counts, totals
+
+
+def _read_zip_member(zfile, buffer, name):
+  r""" Read a member of a zip archive by inflating its compressed bytes in a
+  single call straight from the memory mapped archive `buffer`, bypassing
+  the buffering layers of `ZipFile.read`. Members with other compression
+  methods or encryption fall back to `ZipFile.read`. """
+  info = zfile.getinfo(name)
+  if info.flag_bits & 0x1 or \
+    info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+    return zfile.read(name)
+  # local file header: 30 bytes followed by the file name and extra field
+  header = struct.unpack('<4s2B4HL2L2H',
+                         buffer[info.header_offset:info.header_offset + 30])
+  if header[0] != b'PK\x03\x04':
+    return zfile.read(name)
+  start = info.header_offset + 30 + header[-2] + header[-1]
+  with memoryview(buffer)[start:start + info.compress_size] as raw:
+    if info.compress_type == zipfile.ZIP_STORED:
+      data = bytes(raw)
+    else:
+      data = zlib.decompress(raw, -zlib.MAX_WBITS, info.file_size)
+  if zlib.crc32(data) != info.CRC:
+    raise RuntimeError(f"CRC mismatch for zip member: {name}")
+  return data
+
+
+def _download_and_decrypt(url, md5, download_path, override):
+  r""" Download an encrypted file then decrypt it once to disk in 1MB blocks,
+  the plaintext is kept so later runs could skip the decryption.
+
+  Return:
+    base name of the file and the path to the decrypted zip file
+  """
+  url = str(base64.decodebytes(url), 'utf-8')
+  base_name = os.path.basename(url)
+  path = os.path.join(download_path, base_name)
+  download_file(filename=path, url=url, override=False)
+  dec_path = path + '.dec'
+  md5_path = dec_path + '.md5'
+  # the decrypted file is reused only if it was verified against the
+  # expected MD5 and is newer than the downloaded file
+  if not override and \
+    os.path.exists(dec_path) and os.path.exists(md5_path) and \
+      os.path.getmtime(dec_path) >= os.path.getmtime(path):
+    with open(md5_path, 'r') as f:
+      if f.read().strip() == md5:
+        return base_name, dec_path
+  tmp_path = dec_path + '.tmp'
+  with open(tmp_path, 'wb', buffering=1 << 20) as fout:
+    md5_ = decrypt_aes_stream(path, fout, password=_PASSWORD)
+  if md5_ != md5:
+    os.remove(tmp_path)
+    raise RuntimeError(f"MD5 checksum mismatch for file: {base_name}")
+  os.replace(tmp_path, dec_path)
+  with open(md5_path, 'w') as f:
+    f.write(md5_)
+  return base_name, dec_path
+
+
+def _ensure_preprocessed(filtered_genes, override, verbose):
+  r""" Download, decrypt, parse then save the data to the preprocessed folder,
+  nothing is done if a valid cache already exists
+
+  Return:
+    path to the preprocessed folder
+  """
   download_path = os.path.join(
       DOWNLOAD_DIR,
       "PBMC_%s_original" % ('5000' if filtered_genes else 'CITEseq'))
@@ -53,85 +225,102 @@ def read_CITEseq_PBMC(override=False,
     os.makedirs(download_path)
   preprocessed_path = (_5000_PBMC_PREPROCESSED
                        if filtered_genes else _CITEseq_PBMC_PREPROCESSED)
-  if override:
-    shutil.rmtree(preprocessed_path)
-    os.makedirs(preprocessed_path)
   # ******************** preprocessed data NOT found ******************** #
-  if not os.path.exists(os.path.join(preprocessed_path, 'X')):
-    X, X_row, X_col = [], None, None
-    y, y_row, y_col = [], None, None
-    # ====== download the data ====== #
-    download_files = {}
-    for url, md5 in zip(
-        [_URL_5000 if filtered_genes else _URL_FULL, _URL_PROTEIN],
-        [_MD5_5000 if filtered_genes else _MD5_FULL, _MD5_PROTEIN]):
-      url = str(base64.decodebytes(url), 'utf-8')
-      base_name = os.path.basename(url)
-      path = os.path.join(download_path, base_name)
-      download_file(filename=path, url=url, override=False)
-      download_files[base_name] = (path, md5)
+  if override or not _is_preprocessed(preprocessed_path):
+    # remove stale files (e.g. a partial cache or the old odin Dataset)
+    if os.path.exists(preprocessed_path):
+      shutil.rmtree(preprocessed_path)
+    os.makedirs(preprocessed_path)
+    X, X_row, X_col, X_sum = None, None, None, None
+    y, y_row, y_col = None, None, None
+    # ====== download and decrypt both files concurrently ====== #
+    # the results follow the order of the urls: gene count then protein
+    with ThreadPoolExecutor(max_workers=2) as executor:
+      download_files = list(
+          executor.map(
+              partial(_download_and_decrypt,
+                      download_path=download_path,
+                      override=override),
+              [_URL_5000 if filtered_genes else _URL_FULL, _URL_PROTEIN],
+              [_MD5_5000 if filtered_genes else _MD5_FULL, _MD5_PROTEIN]))
     # ====== extract the data ====== #
-    n = set()
-    for name, (path, md5) in sorted(download_files.items()):
+    for name, dec_path in download_files:
       if verbose:
         print(f"Extracting {name} ...")
-      binary_data = decrypt_aes(path, password=_PASSWORD)
-      md5_ = md5_checksum(binary_data)
-      assert md5_ == md5, f"MD5 checksum mismatch for file: {name}"
-      with zipfile.ZipFile(file=BytesIO(binary_data), mode='r') as f:
+      with open(dec_path, 'rb') as fin, \
+        mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as buffer, \
+          zipfile.ZipFile(file=dec_path, mode='r') as f:
         for name in f.namelist():
-          data = str(f.read(name), 'utf8')
-          for line in data.split('\n'):
-            if len(line) == 0:
-              continue
-            line = line.strip().split(',')
-            n.add(len(line))
-            if 'Protein' in name:
-              y.append(line)
-            else:
-              X.append(line)
+          cell_id, feature_id, counts, totals = _read_counts(
+              _read_zip_member(f, buffer, name))
+          if 'Protein' in name:
+            y, y_row, y_col = counts, cell_id, feature_id
+          else:
+            X, X_row, X_col, X_sum = counts, cell_id, feature_id, totals
     # ====== post-processing ====== #
-    assert len(n) == 1, \
+    assert X.shape[0] == y.shape[0], \
     "Number of samples inconsistent between raw count and protein count"
     if verbose:
       print("Processing gene count ...")
-    X = np.array(X).T
-    X_row, X_col = X[1:, 0], X[0, 1:]
-    X = X[1:, 1:].astype('float32')
-    # ====== filter mouse genes ====== #
-    human_cols = [True if "HUMAN_" in i else False for i in X_col]
+    # ====== filter mouse genes and all-zero genes in one gather ====== #
+    human_cols = np.char.find(X_col, 'HUMAN_') >= 0
+    # at least > 1 for train, test splitting (same as remove_allzeros_columns)
+    nonzero_cols = X_sum > 1
+    keep = human_cols & nonzero_cols
     if verbose:
-      print(f"Removing {np.sum(np.logical_not(human_cols))} MOUSE genes ...")
-    X = X[:, human_cols]
-    X_col = np.array([i.replace('HUMAN_', '') for i in X_col[human_cols]])
-    X, X_col = remove_allzeros_columns(matrix=X,
-                                       colname=X_col,
-                                       print_log=verbose)
+      n_human, n_keep = int(human_cols.sum()), int(keep.sum())
+      print(f"Removing {len(human_cols) - n_human} MOUSE genes ...")
+      print("Filtering %d all-zero columns from data: %s -> %s ..." %
+            (n_human - n_keep, str((X.shape[0], n_human)),
+             str((X.shape[0], n_keep))))
+    X = X[:, keep]
+    X_col = np.char.replace(X_col[keep], 'HUMAN_', '')
 
     # ====== protein ====== #
     if verbose:
       print("Processing protein count ...")
-    y = np.array(y).T
-    y_row, y_col = y[1:, 0], y[0, 1:]
-    y = y[1:, 1:].astype('float32')
     assert np.all(X_row == y_row), \
     "Cell order mismatch between gene count and protein count"
-    # save data
+    # save data, the ids are stored as fixed width unicode so they could be
+    # memory mapped as well
     if verbose:
       print(f"Saving data to {preprocessed_path} ...")
-    save_to_dataset(preprocessed_path,
-                    X,
-                    X_col,
-                    y,
-                    y_col,
-                    rowname=X_row,
-                    print_log=verbose)
-  # ====== read preprocessed data ====== #
-  ds = Dataset(preprocessed_path, read_only=True)
+    for name, arr in zip(_ARRAYS, (X, y, X_row, X_col, y_col)):
+      np.save(os.path.join(preprocessed_path, f'{name}.npy'),
+              np.ascontiguousarray(arr if arr.dtype.kind == 'f' else
+                                   arr.astype(str)))
+  return preprocessed_path
+
+
+@lru_cache(maxsize=4)
+def _open_preprocessed(filtered_genes, verbose):
+  r""" Memory map the preprocessed arrays (including the ids), the result is
+  cached so repeated calls do not touch the file system """
+  preprocessed_path = _ensure_preprocessed(filtered_genes,
+                                           override=False,
+                                           verbose=verbose)
+  return tuple(
+      np.load(os.path.join(preprocessed_path, f'{name}.npy'), mmap_mode='r')
+      for name in _ARRAYS)
+
+
+# ===========================================================================
+# Main
+# ===========================================================================
+def read_CITEseq_PBMC(override=False,
+                      verbose=True,
+                      filtered_genes=False) -> SingleCellOMIC:
+  if override:
+    _open_preprocessed.cache_clear()
+    _ensure_preprocessed(filtered_genes, override=True, verbose=verbose)
+  X, y, X_row, X_col, y_col = _open_preprocessed(bool(filtered_genes),
+                                                 bool(verbose))
+  # a new SingleCellOMIC is created for every call since it is mutable,
+  # only the underlying arrays are shared
   return SingleCellOMIC(
-      X=ds['X'],
-      cell_id=ds['X_row'],
-      gene_id=ds['X_col'],
+      X=X,
+      cell_id=X_row,
+      gene_id=X_col,
       omic='transcriptomic',
       name=f"pbmcCITEseq{'' if filtered_genes else 'all'}",
-  ).add_omic('proteomic', ds['y'], ds['y_col'])
+  ).add_omic('proteomic', y, y_col)
@@ -2,15 +2,20 @@ from __future__ import absolute_import, division, print_function
 
 import base64
 import gzip
+import hashlib
+import inspect
+import mmap
 import os
 import pickle
 import shutil
+import struct
 import tarfile
 import warnings
 import zipfile
 from contextlib import contextmanager
 from copy import deepcopy
-from urllib.request import urlretrieve
+from functools import lru_cache
+from urllib.request import urlopen
 
 import numpy as np
 from scipy import sparse
@@ -19,7 +24,7 @@ from six import string_types
 from bigarray import MmapArrayWriter
 from odin.fuel import Dataset
 from odin.utils import as_tuple, ctext
-from odin.utils.crypto import md5_checksum, md5_folder
+from odin.utils.crypto import md5_checksum, md5_folder, to_password
 
 __all__ = [
     'apply_artificial_corruption',
@@ -32,16 +37,64 @@ __all__ = [
 ]
 
 
+# ===========================================================================
+# Helpers
+# ===========================================================================
+@lru_cache(maxsize=None)
+def _argspec(fn):
+  return inspect.getfullargspec(fn)
+
+
+def cached_argspec(fn) -> inspect.FullArgSpec:
+  r""" Memoized `inspect.getfullargspec`, bound methods are keyed by their
+  underlying function so the cache is shared among instances """
+  return _argspec(getattr(fn, '__func__', fn))
+
+
 # ===========================================================================
 # For reading compressed files
 # ===========================================================================
+_VERIFIED = '.verified'
+
+
+def _latest_mtime(path_dir):
+  r""" Most recent modification time of all files and folders in `path_dir`
+  (the sentinel file is ignored), only the metadata is read. """
+  latest = os.path.getmtime(path_dir)
+  folders = [path_dir]
+  while len(folders) > 0:
+    for entry in os.scandir(folders.pop()):
+      if entry.name == _VERIFIED:
+        continue
+      if entry.is_dir():
+        folders.append(entry.path)
+      latest = max(latest, entry.stat().st_mtime)
+  return latest
+
+
 def validate_data_dir(path_dir, md5):
+  r""" Validate the MD5 of a preprocessed folder, the full checksum is only
+  computed once, then a `.verified` sentinel storing the MD5 is written into
+  the folder and later calls only compare its modification time against the
+  data files. """
   if not os.path.exists(path_dir):
     os.makedirs(path_dir)
-  elif md5_folder(path_dir) != md5:
+    return path_dir
+  sentinel = os.path.join(path_dir, _VERIFIED)
+  if os.path.exists(sentinel) and \
+    os.path.getmtime(sentinel) >= _latest_mtime(path_dir):
+    with open(sentinel, 'r') as f:
+      if f.read().strip() == md5:
+        return path_dir
+  if md5_folder(path_dir,
+                file_filter=lambda path: os.path.basename(path) != _VERIFIED
+               ) != md5:
     shutil.rmtree(path_dir)
     print(f"MD5 preprocessed at {path_dir} mismatch, remove and override!")
     os.makedirs(path_dir)
+  else:
+    with open(sentinel, 'w') as f:
+      f.write(md5)
   return path_dir
 
 
@@ -61,22 +114,84 @@ def download_file(url, filename, override, md5=None):
         os.remove(filename)
     else:  # no MD5 provide just ignore the download if file exist
       return filename
-  prog = [None]
-
-  def progress(blocknum, blocksize, total):
-    if prog[0] is None:
-      prog[0] = tqdm(desc=f"Download {os.path.basename(filename)}",
-                     total=int(total / 1024. / 1024.) + 1,
-                     unit="MB")
-    prog[0].update(int(blocknum * blocksize / 1024. / 1024.) - prog[0].n)
-
-  urlretrieve(url=url, filename=filename, reporthook=progress)
-  prog[0].clear()
-  prog[0].close()
+  # stream the body in 1MB blocks to cut the number of read/write calls
+  blocksize = 1024 * 1024
+  with urlopen(url) as response, \
+    open(filename, 'wb', buffering=blocksize) as f:
+    total = int(response.headers.get('Content-Length', 0))
+    prog = tqdm(desc=f"Download {os.path.basename(filename)}",
+                total=int(total / 1024. / 1024.) + 1,
+                unit="MB")
+    buffer = bytearray(blocksize)
+    downloaded = 0
+    while True:
+      n = response.readinto(buffer)
+      if not n:
+        break
+      f.write(memoryview(buffer)[:n])
+      downloaded += n
+      prog.update(int(downloaded / 1024. / 1024.) - prog.n)
+  prog.clear()
+  prog.close()
   print(f"File '{filename}' md5:{md5_checksum(filename)}")
   return filename
 
 
+def decrypt_aes_stream(in_file, outfile, password, salt=None,
+                       chunksize=1 << 20):
+  r""" Decrypt a file encrypted by `odin.utils.crypto.encrypt_aes` block by
+  block, the plaintext is written to `outfile` and the MD5 checksum is updated
+  on the fly, so the decrypted data is never held entirely in memory.
+
+  The decryption is done by OpenSSL (AES-NI if available) via `cryptography`,
+  `pycryptodome` is used as fallback if the package is not installed.
+
+  Arguments:
+    in_file : path to the encrypted file
+    outfile : a writable file object
+    password : the password used for encryption
+    chunksize : an Integer, number of bytes decrypted at once (default: 1MB)
+
+  Return:
+    the MD5 checksum (hex digest) of the decrypted data
+  """
+  # must be multiple of the AES block size
+  chunksize = max(16, int(chunksize) // 16 * 16)
+  key = to_password(password, salt)
+  hash_md5 = hashlib.md5()
+  with open(in_file, 'rb') as f, \
+    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+    # header: original size and the initial vector
+    offset = struct.calcsize('Q')
+    remain = struct.unpack('<Q', mm[:offset])[0]
+    iv = mm[offset:offset + 16]
+    offset += 16
+    try:
+      from cryptography.hazmat.backends import default_backend
+      from cryptography.hazmat.primitives.ciphers import (Cipher, algorithms,
+                                                          modes)
+      decryptor = Cipher(algorithms.AES(key),
+                         modes.CBC(iv),
+                         backend=default_backend()).decryptor()
+      buffer = bytearray(chunksize + 15)
+      view = memoryview(buffer)
+      decrypt = lambda chunk: view[:decryptor.update_into(chunk, buffer)]
+    except ImportError:
+      from Crypto.Cipher import AES
+      decrypt = AES.new(key, AES.MODE_CBC, IV=iv).decrypt
+    with memoryview(mm) as data:
+      for start in range(offset, len(data), chunksize):
+        # remove the padding of the last block
+        chunk = decrypt(data[start:start + chunksize])[:remain]
+        remain -= len(chunk)
+        hash_md5.update(chunk)
+        # raw (unbuffered) files may write only part of the chunk
+        while len(chunk) > 0:
+          chunk = chunk[outfile.write(chunk):]
+  outfile.flush()
+  return hash_md5.hexdigest()
+
+
 def read_r_matrix(matrix):
   r"""Convert (and transpose) a dgCMatrix from R to a csr_matrix in python
 
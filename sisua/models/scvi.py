@@ -91,12 +91,13 @@ class SCVI(SingleCellModel):
              training=None,
              mask=None,
              sample_shape=(),
+             log_inputs=None,
              **kwargs):
     qZ_X = super().encode(inputs=inputs,
-                          library=library,
                           training=training,
                           mask=mask,
-                          sample_shape=sample_shape)
+                          sample_shape=sample_shape,
+                          log_inputs=log_inputs)
     if library is not None:
       mean, var = tf.split(tf.nest.flatten(library)[0], 2, axis=1)
       pL = Independent(Normal(loc=mean, scale=tf.math.sqrt(var)), 1)
@@ -167,9 +168,33 @@ class SCVI(SingleCellModel):
       shape = tf.concat(
           [output_shape, tf.convert_to_tensor(d.shape[1:])], axis=0)
       d = tf.reshape(d, shape)
-    pY = [p(d, training=training) for p in self.posteriors[1:]]
+    pY = self._decode_heads(d, training=training)
     return [pX] + pY
 
+  def _decode_heads(self, d, training=None):
+    r""" Parameterize the semi-supervised posteriors from the decoder output,
+    the projections of all heads are fused into a single matrix
+    multiplication when possible """
+    heads = self.posteriors[1:]
+    if len(heads) < 2 or not all(p.projection and p.built for p in heads):
+      return [p(d, training=training) for p in heads]
+    kernel = tf.concat([p.kernel for p in heads], axis=1)
+    params = tf.tensordot(d, kernel, axes=1)
+    if any(p.use_bias for p in heads):
+      bias = [
+          p.bias if p.use_bias else tf.zeros((p.units,), dtype=p.dtype)
+          for p in heads
+      ]
+      params += tf.concat(bias, axis=0)
+    params = tf.split(params, [p.units for p in heads], axis=-1)
+    # `Layer.__call__` would check the projected params against the
+    # `input_spec` of the head (i.e. the decoder output) and fail when traced
+    # in graph mode, so the distributions are created by `call` directly
+    return [
+        p.call(p.activation(x), training=training, projection=False)
+        for p, x in zip(heads, params)
+    ]
+
 
 class TotalVI(SingleCellModel):
   pass
@@ -15,6 +15,7 @@ import numpy as np
 import tensorflow as tf
 from six import add_metaclass, string_types
 from tensorflow import keras
+from tensorflow.python.training.tracking import base as trackable
 from tensorflow.python.data import Dataset
 from tensorflow.python.data.ops.dataset_ops import DatasetV2
 from tensorflow.python.keras.callbacks import (Callback, CallbackList,
@@ -41,9 +42,11 @@ __all__ = [
 ]
 
 
-def _to_data(x, batch_size=64) -> Dataset:
+def _to_data(x, batch_size=64, log_norm=False, library=True) -> Dataset:
   if isinstance(x, SingleCellOMIC):
-    inputs = x.create_dataset(batch_size=batch_size)
+    inputs = x.create_dataset(batch_size=batch_size,
+                              log_norm=log_norm,
+                              library=library)
   elif isinstance(x, DatasetV2):
     inputs = x
   # given numpy ndarrays
@@ -57,10 +60,32 @@ def _to_data(x, batch_size=64) -> Dataset:
         inputs.add_omic(omic=om_random, X=arr)
     inputs = inputs.create_dataset(inputs.omics,
                                    batch_size=batch_size,
-                                   drop_remainder=True)
+                                   drop_remainder=True,
+                                   log_norm=log_norm,
+                                   library=library)
   return inputs
 
 
+def _as_sample_shape(sample_shape):
+  r""" Normalize `sample_shape` to a tuple, the common empty shape always
+  becomes `()` so the sampling and reshaping branches are skipped """
+  if sample_shape is None:
+    return ()
+  if isinstance(sample_shape, Number):
+    return (int(sample_shape),)
+  if isinstance(sample_shape, list):
+    return tuple(sample_shape)
+  return sample_shape
+
+
+def _add_log_inputs(data):
+  r""" Precompute the log-normalized first input in the input pipeline """
+  if isinstance(data, dict) and 'inputs' in data:
+    data = dict(data)
+    data['log_inputs'] = tf.math.log1p(tf.nest.flatten(data['inputs'])[0])
+  return data
+
+
 # ===========================================================================
 # SingleCell model
 # ===========================================================================
@@ -99,6 +124,15 @@ class SingleCellModel(BetaVAE, Visualizer):
     self.dataset = None
     self.metadata = dict()
     self._n_inputs = max(len(l.inputs) for l in tf.nest.flatten(self.encoder))
+    # trace the forward pass of the networks into graphs once, so minibatch
+    # prediction does not dispatch every op eagerly. Only the networks are
+    # compiled, the distribution layers stay in python since a Distribution
+    # could not be returned from a graph function.
+    for network in (tf.nest.flatten(self.encoder) +
+                    tf.nest.flatten(self.decoder)):
+      with trackable.no_automatic_dependency_tracking_scope(network):
+        network.call = tf.function(network.call,
+                                   experimental_relax_shapes=True)
 
   def set_metadata(self, sco: SingleCellOMIC):
     assert isinstance(sco, SingleCellOMIC), \
@@ -112,30 +146,39 @@ class SingleCellModel(BetaVAE, Visualizer):
   def log_norm(self):
     return self._log_norm
 
+  @property
+  def uses_library(self):
+    r""" True if the library size is consumed by the model, i.e. `encode` or
+    `decode` declares the `library` argument """
+    return 'library' in self._encode_kw or 'library' in self._decode_kw
+
   @property
   def is_zero_inflated(self):
     return self.posteriors[0].is_zero_inflated
 
   def encode(self,
              inputs,
-             library=None,
              training=None,
              mask=None,
              sample_shape=(),
+             log_inputs=None,
              **kwargs):
-    if self.log_norm:
-      if tf.is_tensor(inputs):
-        inputs = tf.math.log1p(inputs)
-      else:
-        inputs = tf.nest.flatten(inputs)
-        inputs[0] = tf.math.log1p(inputs[0])
-    # just limit the number of inputs
+    r""" Encoding inputs to latent codes, `log_inputs` is the precomputed
+    `log1p` of the first input, if given, it is used instead of recomputing
+    the log-normalization """
+    # just limit the number of inputs, then only the first one is normalized
+    # (a single tensor skips the list handling entirely)
     if isinstance(inputs, (tuple, list)):
-      inputs = inputs[:self._n_inputs]
+      inputs = list(inputs[:self._n_inputs])
+      if self.log_norm:
+        inputs[0] = (tf.math.log1p(inputs[0])
+                     if log_inputs is None else log_inputs)
+    elif self.log_norm:
+      inputs = tf.math.log1p(inputs) if log_inputs is None else log_inputs
     return super().encode(inputs=inputs,
                           training=training,
                           mask=mask,
-                          sample_shape=sample_shape,
+                          sample_shape=_as_sample_shape(sample_shape),
                           **kwargs)
 
   def decode(self,
@@ -147,7 +190,7 @@ class SingleCellModel(BetaVAE, Visualizer):
     return super().decode(latents=latents,
                           training=training,
                           mask=mask,
-                          sample_shape=sample_shape,
+                          sample_shape=_as_sample_shape(sample_shape),
                           **kwargs)
 
   def predict(self,
@@ -169,54 +212,71 @@ class SingleCellModel(BetaVAE, Visualizer):
     """
     assert device in ("CPU", "GPU"), \
       f"Only support device CPU or GPU, but given: {device}"
-    inputs = _to_data(inputs, batch_size=batch_size)
-    ## making predictions
-    X, Z = [], []
-    prog = tqdm(inputs, desc="Predicting", disable=not bool(verbose))
+    inputs = _to_data(inputs,
+                      batch_size=batch_size,
+                      library=self.uses_library)
+    sample_shape = _as_sample_shape(sample_shape)
+    # the log-normalization runs in the input pipeline, overlapping with the
+    # forward pass of the previous minibatch
+    if self.log_norm and 'log_inputs' in self._encode_kw:
+      inputs = inputs.map(_add_log_inputs,
+                          num_parallel_calls=tf.data.experimental.AUTOTUNE)
+    # copy the next minibatches to the GPU while the current one is running
+    if device == "GPU" and len(tf.config.list_physical_devices('GPU')) > 0:
+      inputs = inputs.apply(
+          tf.data.experimental.prefetch_to_device('/GPU:0', buffer_size=2))
+    else:
+      inputs = inputs.prefetch(tf.data.experimental.AUTOTUNE)
+    ## making predictions, the distributions of each output (and latent) are
+    # gathered into their own list while predicting, so every one of them is
+    # concatenated once at the end
+    X, Z = None, None
+    # refresh the progress bar at most twice per second so it does not
+    # stall the dispatch of the minibatches
+    prog = tqdm(inputs,
+                desc="Predicting",
+                mininterval=0.5,
+                disable=not bool(verbose))
     with tf.device(f"/{device}:0"):
       for data in prog:
         pX_Z, qZ_X = self(**data, training=False, sample_shape=sample_shape)
-        X.append(pX_Z)
-        Z.append(qZ_X)
+        if X is None:
+          multi_X = isinstance(pX_Z, (tuple, list))
+          multi_Z = isinstance(qZ_X, (tuple, list))
+          X = [[] for _ in (pX_Z if multi_X else [pX_Z])]
+          Z = [[] for _ in (qZ_X if multi_Z else [qZ_X])]
+        for x, p in zip(X, pX_Z if multi_X else [pX_Z]):
+          x.append(p)
+        for z, q in zip(Z, qZ_X if multi_Z else [qZ_X]):
+          z.append(q)
       prog.clear()
       prog.close()
     # merging the batch distributions
-    if isinstance(pX_Z, (tuple, list)):
-      merging_axis = 0 if pX_Z[0].batch_shape.ndims == 1 else 1
-    else:
-      merging_axis = 0 if pX_Z.batch_shape.ndims == 1 else 1
+    merging_axis = 0 if X[0][0].batch_shape.ndims == 1 else 1
     with tf.device("/CPU:0"):
-      # multiple outputs
-      if isinstance(X[0], (tuple, list)):
-        X = tuple([
-            concat_distributions([x[idx] for x in X], \
-                                axis=merging_axis,
-                                name=self.posteriors[idx].name)
-            for idx in range(len(X[0]))
-        ])
-      # single output
-      else:
-        X = concat_distributions(X,
-                                 axis=merging_axis,
-                                 name=self.posteriors[0].name)
-      # multiple latents
-      if isinstance(Z[0], (tuple, list)):
-        Z = tuple([
-            concat_distributions([z[idx]
-                                  for z in Z], axis=0)
-            for idx in range(len(Z[0]))
-        ])
-      else:
-        Z = concat_distributions(Z, axis=0)
+      X = [
+          concat_distributions(x, axis=merging_axis, name=posterior.name)
+          for x, posterior in zip(X, self.posteriors)
+      ]
+      Z = [concat_distributions(z, axis=0) for z in Z]
+    X = tuple(X) if multi_X else X[0]
+    Z = tuple(Z) if multi_Z else Z[0]
     return X, Z
 
   def fit(self,
           train: Union[SingleCellOMIC, DatasetV2],
           valid: Union[SingleCellOMIC, DatasetV2] = None,
           metadata: SingleCellOMIC = None,
+          jit_compile=False,
           **kwargs):
     r""" This fit function is the combination of both
-    `Model.compile` and `Model.fit` """
+    `Model.compile` and `Model.fit`
+
+    Arguments:
+      jit_compile : a Boolean. If True, enable XLA auto-clustering while
+        training so the chains of element-wise ops in the compiled train step
+        are fused, the previous setting is restored afterward.
+    """
     ## preprocessing the data
     if isinstance(train, SingleCellOMIC):
       self.set_metadata(train)
@@ -230,10 +290,25 @@ class SingleCellModel(BetaVAE, Visualizer):
           "SingleCellOMIC dataset to keep the dataset name and OMICs' "
           "variables description.")
     batch_size = kwargs.pop('batch_size', 64)
-    train = _to_data(train, batch_size=batch_size)
+    # the log-normalized inputs are cached with the dataset, so the log1p is
+    # not recomputed every epoch
+    log_norm = self.log_norm and 'log_inputs' in self._encode_kw
+    train = _to_data(train,
+                     batch_size=batch_size,
+                     log_norm=log_norm,
+                     library=self.uses_library)
     if valid is not None:
-      valid = _to_data(valid, batch_size=batch_size)
-    return super().fit(train=train, valid=valid, analytic=analytic, **kwargs)
+      valid = _to_data(valid,
+                       batch_size=batch_size,
+                       log_norm=log_norm,
+                       library=self.uses_library)
+    jit = tf.config.optimizer.get_jit()
+    if jit_compile:
+      tf.config.optimizer.set_jit(True)
+    try:
+      return super().fit(train=train, valid=valid, analytic=analytic, **kwargs)
+    finally:
+      tf.config.optimizer.set_jit(jit)
 
   @classproperty
   def id(cls):
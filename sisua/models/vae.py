@@ -43,6 +43,22 @@ class SISUA(MultitaskVAE, SingleCellModel):
                      input_shape=tf.nest.flatten(outputs)[0].event_shape,
                      **kwargs)
 
+  def encode(self,
+             inputs,
+             training=None,
+             mask=None,
+             sample_shape=(),
+             log_inputs=None,
+             **kwargs):
+    # explicitly declare `log_inputs`, so the precomputed log-normalization
+    # from the dataset is forwarded through `MultitaskVAE.encode`
+    return super().encode(inputs,
+                          training=training,
+                          mask=mask,
+                          sample_shape=sample_shape,
+                          log_inputs=log_inputs,
+                          **kwargs)
+
 
 class MISA(SISUA):
   r""" MIxture of labels for Semi-supervised Autoencoder
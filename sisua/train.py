@@ -1,6 +1,5 @@
 from __future__ import absolute_import, division, print_function
 
-import inspect
 import os
 import sys
 from functools import partial
@@ -14,6 +13,7 @@ from odin.exp import Experimenter
 from sisua.analysis import Posterior
 from sisua.data import (CONFIG_PATH, DATA_DIR, EXP_DIR, OMIC, SingleCellOMIC,
                         get_dataset, get_dataset_meta)
+from sisua.data.utils import cached_argspec
 from sisua.models import (NetworkConfig, RandomVariable, get_all_models,
                           get_model)
 
@@ -30,7 +30,7 @@ np.random.seed(8)
 # ===========================================================================
 def _from_config(cfg, fn, overrides={}):
   assert callable(fn)
-  spec = inspect.getfullargspec(fn)
+  spec = cached_argspec(fn)
   kw = {
       k: v for k, v in cfg.items() if k in spec.args or spec.varkw is not None
   }
@@ -93,7 +93,7 @@ class SisuaExperimenter(Experimenter):
                      encoder=encoder,
                      decoder=decoder)
     # check if semi-supervised
-    if 'labels' in inspect.getfullargspec(cls.__init__).args:
+    if 'labels' in cached_argspec(cls.__init__).args:
       # there might be case with no labels data available for semi-supervised
       # learning
       overrides['labels'] = [
@@ -123,16 +123,22 @@ class SisuaExperimenter(Experimenter):
                   inplace=True)
     if cfg.verbose:
       print(train)
+    # same dataset options as `SingleCellModel.fit`
+    log_norm = self.model.log_norm and 'log_inputs' in self.model._encode_kw
     train = train.create_dataset(self.omics,
                                  labels_percent=cfg.dataset.labels_percent,
                                  batch_size=cfg.dataset.batch_size,
                                  drop_remainder=True,
-                                 shuffle=1000)
+                                 shuffle=1000,
+                                 log_norm=log_norm,
+                                 library=self.model.uses_library)
     valid = valid.create_dataset(self.omics,
                                  labels_percent=cfg.dataset.labels_percent,
                                  batch_size=cfg.dataset.batch_size,
                                  drop_remainder=True,
-                                 shuffle=1000)
+                                 shuffle=1000,
+                                 log_norm=log_norm,
+                                 library=self.model.uses_library)
     if cfg.verbose:
       print(train)
     sample_shape = tuple(cfg.train.sample_shape)
@@ -1,7 +1,10 @@
+from collections import namedtuple
+
 import numpy as np
 import pandas as pd
 import seaborn
 from matplotlib import pyplot as plt
+from scipy.sparse import issparse
 from scipy.stats import entropy, kde
 
 from odin import backend as K
@@ -14,6 +17,42 @@ from odin.visual import plot_series_statistics
 # ===========================================================================
 # Some helper
 # ===========================================================================
+Reconstruction = namedtuple('Reconstruction',
+                            ['mean', 'stdev_total', 'stdev_explained'])
+Reconstruction.__doc__ = \
+  """ Reconstruction statistics of a VAE stored as separated contiguous
+  [n_samples, n_genes] arrays (struct of arrays), so reductions over each
+  statistic do not stride through a stacked ndim-3 array """
+
+
+def _to_reconstruction(W_or_V):
+  r""" Convert the (mean, total_stddev, explained_stddev) tuple or the
+  stacked ndim-3 array into `Reconstruction` of contiguous arrays """
+  if isinstance(W_or_V, Reconstruction):
+    return W_or_V
+  if isinstance(W_or_V, (tuple, list)):
+    assert len(W_or_V) == 3
+  else:
+    assert W_or_V.ndim == 3 and W_or_V.shape[0] == 3
+  return Reconstruction(
+      *[w if issparse(w) else np.ascontiguousarray(w) for w in W_or_V])
+
+
+def _median(a, axis=None):
+  r""" Median by selection in O(n) using `np.partition` instead of a full
+  sort, the array is flattened if `axis` is None """
+  if axis is None:
+    a, axis = np.ravel(a), 0
+  else:
+    a = np.asarray(a)
+  n = a.shape[axis]
+  k = n // 2
+  if n % 2:
+    return np.take(np.partition(a, k, axis=axis), k, axis=axis)
+  part = np.partition(a, (k - 1, k), axis=axis)
+  return 0.5 * (np.take(part, k - 1, axis=axis) + np.take(part, k, axis=axis))
+
+
 def _mean(W_or_V):
   """ The reconstruction from VAE is returned by:
   (mean, total_stddev, explained_stddev)
@@ -51,29 +90,32 @@ def plot_countsum_series(original,
   """
   x: [n_samples, n_genes]
     original count
-  w: tuple (expected, stdev_total, stdev_explained) [n_samples, n_genes]
-    the prediction
+  w: `Reconstruction` or tuple (expected, stdev_total, stdev_explained)
+    [n_samples, n_genes], the prediction
   p: [n_samples, n_genes]
     dropout probability
   """
   if ax is None:
     ax = visual.to_axis(ax)
-  reduce_axis = int(reduce_axis)
-
-  if isinstance(imputed, (tuple, list)):  # no statistics provided
-    assert len(imputed) == 3
-    expected, stdev_total, stdev_explained = imputed
-  elif imputed.ndim == 3:
-    assert imputed.shape[0] == 3
-    expected, stdev_total, stdev_explained = imputed[0], imputed[1], imputed[2]
-  else:
-    raise ValueError()
-
-  count_sum_observed = np.log1p(np.sum(original, axis=reduce_axis))
-  count_sum_expected = np.log1p(np.sum(expected, axis=reduce_axis))
-  count_sum_stdev_total = np.log1p(np.sum(stdev_total, axis=reduce_axis))
-  count_sum_stdev_explained = np.log1p(np.sum(stdev_explained,
-                                              axis=reduce_axis))
+  reduce_axis = int(reduce_axis) % original.ndim
+
+  expected, stdev_total, stdev_explained = _to_reconstruction(imputed)
+
+  # reduce each matrix straight into one preallocated float32 buffer (the
+  # inputs are cast blockwise, never upcast to float64), then apply a single
+  # in-place log1p
+  count_sum = np.empty(shape=(4, original.shape[1 - reduce_axis]),
+                       dtype=np.float32)
+  for arr, out in zip((original, expected, stdev_total, stdev_explained),
+                      count_sum):
+    if issparse(arr):
+      # sparse sums return `np.matrix` which cannot be written into `out`
+      out[:] = np.asarray(arr.sum(axis=reduce_axis)).ravel()
+    else:
+      np.add.reduce(arr, axis=reduce_axis, dtype=np.float32, out=out)
+  np.log1p(count_sum, out=count_sum)
+  (count_sum_observed, count_sum_expected, count_sum_stdev_total,
+   count_sum_stdev_explained) = count_sum
   if p is not None:
     p_sum = np.mean(p, axis=reduce_axis)
 
@@ -105,31 +147,42 @@ def plot_countsum_comparison(original,
                              imputed,
                              title,
                              comparing_axis=0,
-                             ax=None):
+                             ax=None,
+                             max_points=10000,
+                             random_state=1):
   """
   original : [n_samples, n_genes]
   reconstructed : [n_samples, n_genes]
   imputed : [n_samples, n_genes]
+  max_points : maximum number of points drawn in the scatter plots, a random
+    subset is drawn if there are more (the medians use all points)
   """
   from matplotlib import pyplot as plt
   ax = visual.to_axis(ax)
 
-  original = original.sum(axis=comparing_axis)
-  reconstructed = _mean(reconstructed).sum(axis=comparing_axis)
-  imputed = _mean(imputed).sum(axis=comparing_axis)
+  original = original.sum(axis=comparing_axis, dtype=np.float32)
+  reconstructed = _mean(reconstructed).sum(axis=comparing_axis,
+                                           dtype=np.float32)
+  imputed = _mean(imputed).sum(axis=comparing_axis, dtype=np.float32)
   assert original.shape == reconstructed.shape == imputed.shape
 
-  sorted_indices = np.argsort(original)
-
-  original = np.log1p(original[sorted_indices])
-  reconstructed = np.log1p(reconstructed[sorted_indices])
-  imputed = np.log1p(imputed[sorted_indices])
+  original = np.log1p(original, out=original)
+  reconstructed = np.log1p(reconstructed, out=reconstructed)
+  imputed = np.log1p(imputed, out=imputed)
+  # the order of the points does not matter for the scatter plots, only a
+  # random subset is drawn instead of sorting all of them
+  if original.shape[0] > max_points:
+    ids = np.random.default_rng(random_state).choice(original.shape[0],
+                                                     size=int(max_points),
+                                                     replace=False)
+  else:
+    ids = slice(None)
 
   # ====== plotting the figures ====== #
   colors = seaborn.color_palette(palette='Set2', n_colors=3)
 
-  ax.scatter(original, imputed, c=colors[1], s=3, alpha=0.3)
-  ax.scatter(original, reconstructed, c=colors[2], s=3, alpha=0.3)
+  ax.scatter(original[ids], imputed[ids], c=colors[1], s=3, alpha=0.3)
+  ax.scatter(original[ids], reconstructed[ids], c=colors[2], s=3, alpha=0.3)
   # ====== plotting the median line ====== #
   xmin, xmax = ax.get_xlim()
   ymin, ymax = ax.get_ylim()
@@ -137,21 +190,21 @@ def plot_countsum_comparison(original,
 
   ax.axhline(xmin=0,
              xmax=max_val,
-             y=np.median(original),
+             y=_median(original),
              color=colors[0],
              linestyle='--',
              linewidth=1.5,
              label="Corrupted Median")
   ax.axhline(xmin=0,
              xmax=max_val,
-             y=np.median(imputed),
+             y=_median(imputed),
              color=colors[1],
              linestyle='--',
              linewidth=1.5,
              label="Imputed Median")
   ax.axhline(xmin=0,
              xmax=max_val,
-             y=np.median(reconstructed),
+             y=_median(reconstructed),
              color=colors[2],
              linestyle='--',
              linewidth=1.5,
@@ -19,6 +19,7 @@ from odin.visual import (generate_random_colors, generate_random_marker,
                          plot_scatter, plot_scatter_layers,
                          plot_series_statistics, subplot)
 from sisua.utils.others import anything2image
+from sisua.utils.plot_utils import _to_reconstruction
 
 sbn.set()
 
@@ -200,15 +201,10 @@ def plot_evaluate_reconstruction(X,
   fontsize = 12
 
   W_stdev_total, W_stdev_explained = None, None
-  if isinstance(W, (tuple, list)):
-    if len(W) == 1:
-      W = W[0]
-    elif len(W) == 3:
-      W, W_stdev_total, W_stdev_explained = W
-    else:
-      raise RuntimeError()
-  elif W.ndim == 3:
-    W, W_stdev_total, W_stdev_explained = W[0], W[1], W[2]
+  if isinstance(W, (tuple, list)) and len(W) == 1:
+    W = W[0]
+  elif isinstance(W, (tuple, list)) or W.ndim == 3:
+    W, W_stdev_total, W_stdev_explained = _to_reconstruction(W)
   # convert the prediction to integer
   # W = W.astype('int32')
 
@@ -716,7 +712,7 @@ def plot_monitoring_epoch(X, X_drop, y, Z, Z_drop, W_outputs, W_drop_outputs,
       def plot_count_sum_series(x, w, p, row_start, tit):
         if len(w) != 3:  # no statistics provided
           return
-        expected, stdev_total, stdev_explained = w
+        expected, stdev_total, stdev_explained = _to_reconstruction(w)
         count_sum_observed = np.sum(x, axis=0)
         count_sum_expected = np.sum(expected, axis=0)
         count_sum_stdev_total = np.sum(stdev_total, axis=0)
@@ -0,0 +1,127 @@
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import io
+import os
+import shutil
+import sys
+import unittest
+import zipfile
+from tempfile import mkdtemp
+from unittest import mock
+
+import numpy as np
+
+from odin.utils.crypto import encrypt_aes
+from sisua.data.data_loader.pbmc_CITEseq import _read_counts, _read_zip_member
+from sisua.data.utils import decrypt_aes_stream
+
+np.random.seed(8)
+
+_PASSWORD = 'uef-czi'
+
+
+# ===========================================================================
+# Helpers
+# ===========================================================================
+def _read_counts_lines(data):
+  r""" The original per-line parser, used as reference """
+  lines = []
+  for line in str(data, 'utf8').split('\n'):
+    if len(line) == 0:
+      continue
+    lines.append(line.strip().split(','))
+  x = np.array(lines).T
+  return x[1:, 0], x[0, 1:], x[1:, 1:].astype('float32')
+
+
+def _random_csv(n_features, n_cells):
+  counts = np.random.poisson(lam=2., size=(n_features, n_cells))
+  counts[np.random.rand(*counts.shape) < 0.5] = 0
+  lines = [','.join([''] + ['cell%d' % i for i in range(n_cells)])]
+  for i, row in enumerate(counts):
+    name = ('HUMAN_gene%d' if i % 3 else 'MOUSE_gene%d') % i
+    lines.append(','.join([name] + [str(c) for c in row]))
+  return bytes('\n'.join(lines) + '\n', 'ascii')
+
+
+class _ShortWriter(io.RawIOBase):
+  r""" Unbuffered writer which writes at most 1000 bytes per call """
+
+  def __init__(self):
+    self.data = bytearray()
+
+  def writable(self):
+    return True
+
+  def write(self, b):
+    b = bytes(b[:1000])
+    self.data += b
+    return len(b)
+
+
+# ===========================================================================
+# Tests
+# ===========================================================================
+class PbmcCITEseqTest(unittest.TestCase):
+
+  def setUp(self):
+    self.path = mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+  def test_decrypt_aes_stream(self):
+    for size in (0, 15, 16, 17, (1 << 20) - 1, 1 << 20, (1 << 20) + 1):
+      data = np.random.randint(0, 256, size=size, dtype=np.uint8).tobytes()
+      in_file = os.path.join(self.path, 'data.enc')
+      with open(in_file, 'wb') as f:
+        f.write(encrypt_aes(data, password=_PASSWORD))
+      outfile = io.BytesIO()
+      md5 = decrypt_aes_stream(in_file, outfile, password=_PASSWORD)
+      self.assertEqual(outfile.getvalue(), data, "size=%d" % size)
+      self.assertEqual(md5, hashlib.md5(data).hexdigest(), "size=%d" % size)
+      # partial writes of an unbuffered file
+      outfile = _ShortWriter()
+      decrypt_aes_stream(in_file, outfile, password=_PASSWORD)
+      self.assertEqual(bytes(outfile.data), data, "size=%d" % size)
+
+  def _assert_counts(self, data):
+    cell_id, feature_id, counts, totals = _read_counts(data, chunksize=7)
+    X_row, X_col, X = _read_counts_lines(data)
+    self.assertTrue(np.all(cell_id == X_row))
+    self.assertTrue(np.all(feature_id == X_col))
+    self.assertEqual(counts.dtype, np.float32)
+    self.assertTrue(np.array_equal(counts, X))
+    self.assertTrue(np.allclose(totals, np.sum(X, axis=0)))
+
+  def test_read_counts(self):
+    data = _random_csv(n_features=50, n_cells=20)
+    self._assert_counts(data)
+    # the pandas parser when pyarrow is not available
+    with mock.patch.dict(sys.modules, {'pyarrow': None, 'pyarrow.csv': None}):
+      self._assert_counts(data)
+
+  def test_read_zip_member(self):
+    data = {
+        'gene.csv': _random_csv(n_features=120, n_cells=30),
+        'protein.csv': _random_csv(n_features=10, n_cells=30)
+    }
+    for compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+      path = os.path.join(self.path, 'data.zip')
+      with zipfile.ZipFile(path, mode='w', compression=compression) as f:
+        for name, content in data.items():
+          f.writestr(name, content)
+      with open(path, 'rb') as f:
+        buffer = f.read()
+      with zipfile.ZipFile(path, mode='r') as f:
+        for name, content in data.items():
+          member = _read_zip_member(f, buffer, name)
+          self.assertEqual(member, f.read(name))
+          self.assertEqual(member, content)
+          for x, y in zip(_read_counts(member)[:3], _read_counts_lines(content)):
+            self.assertTrue(np.array_equal(x, y))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,85 @@
+from __future__ import absolute_import, division, print_function
+
+import unittest
+from unittest import mock
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from matplotlib import pyplot as plt
+from scipy import sparse
+
+from sisua.utils import plot_utils
+
+np.random.seed(8)
+
+
+class PlotUtilsTest(unittest.TestCase):
+
+  def tearDown(self):
+    plt.close('all')
+
+  def test_median(self):
+    for n in (1, 2, 7, 10):
+      x = np.random.rand(n)
+      self.assertTrue(np.allclose(plot_utils._median(x), np.median(x)))
+    for shape in ((1, 3), (5, 4), (6, 7)):
+      x = np.random.rand(*shape).astype(np.float32)
+      self.assertTrue(np.allclose(plot_utils._median(x), np.median(x)))
+      for axis in (0, 1, -1):
+        self.assertTrue(
+            np.allclose(plot_utils._median(x, axis=axis),
+                        np.median(x, axis=axis)))
+
+  def test_to_reconstruction(self):
+    w = [np.random.rand(8, 5).astype(np.float32) for _ in range(3)]
+    for imputed in (w, tuple(w), np.stack(w)):
+      rec = plot_utils._to_reconstruction(imputed)
+      self.assertTrue(isinstance(rec, plot_utils.Reconstruction))
+      for i, j in zip(rec, w):
+        self.assertTrue(i.flags['C_CONTIGUOUS'])
+        self.assertTrue(np.array_equal(i, j))
+      self.assertTrue(np.array_equal(plot_utils._mean(rec), w[0]))
+      self.assertTrue(plot_utils._to_reconstruction(rec) is rec)
+    # stacked along the last axis, the slices are not contiguous
+    rec = plot_utils._to_reconstruction(np.stack(w, axis=-1).transpose(2, 0, 1))
+    self.assertTrue(all(i.flags['C_CONTIGUOUS'] for i in rec))
+    with self.assertRaises(AssertionError):
+      plot_utils._to_reconstruction(w[:2])
+
+  def _countsum_series(self, original, imputed, reduce_axis):
+    r""" Return the count sums given to `plot_series_statistics` """
+    _, ax = plt.subplots()
+    with mock.patch.object(plot_utils,
+                           'plot_series_statistics',
+                           return_value=(ax, [], None)) as plot:
+      plot_utils.plot_countsum_series(original,
+                                      imputed,
+                                      reduce_axis=reduce_axis,
+                                      ax=ax)
+    args, kwargs = plot.call_args
+    return (args[0], args[1], kwargs['total_stdev'],
+            kwargs['explained_stdev'])
+
+  def test_countsum_series(self):
+    x = np.random.poisson(2., size=(20, 12)).astype(np.float32)
+    w = [np.random.rand(*x.shape).astype(np.float32) for _ in range(3)]
+    for reduce_axis in (0, 1, -1):
+      desired = [np.log1p(np.sum(i, axis=reduce_axis)) for i in [x] + w]
+      for imputed in (w, np.stack(w)):
+        for actual, expected in zip(
+            self._countsum_series(x, imputed, reduce_axis), desired):
+          self.assertEqual(actual.shape, (x.shape[1 - reduce_axis % 2],))
+          self.assertTrue(np.allclose(actual, expected))
+    # sparse original and imputed counts
+    for reduce_axis in (0, 1):
+      desired = [np.log1p(np.sum(i, axis=reduce_axis)) for i in [x] + w]
+      actual = self._countsum_series(sparse.csr_matrix(x),
+                                     [sparse.csr_matrix(i) for i in w],
+                                     reduce_axis)
+      for a, d in zip(actual, desired):
+        self.assertTrue(np.allclose(a, d))
+
+
+if __name__ == '__main__':
+  unittest.main()
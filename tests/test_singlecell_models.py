@@ -97,6 +97,7 @@ class ModelTest(unittest.TestCase):
     dca = DeepCountAutoencoder(outputs=RandomVariable(dim=sco.n_vars,
                                                       posterior='mse'),
                                latent_dim=10)
+    self.assertFalse(dca.uses_library)
     dca.fit(train, epochs=_EPOCHS, verbose=False)
     dca.fit(train.numpy(), epochs=_EPOCHS, verbose=False)
     self._loss_not_rise(dca.train_history['loss'])
@@ -168,6 +169,7 @@ class ModelTest(unittest.TestCase):
     sco = get_dataset(_DS)
     train, test = sco.split()
     scvi = SCVI(RandomVariable(sco.n_vars, posterior='zinbd', name='rna'))
+    self.assertTrue(scvi.uses_library)
     scvi.fit(train, epochs=_EPOCHS, verbose=False)
     pX, (qZ, qL) = scvi.predict(test, verbose=False)
 
@@ -187,6 +189,28 @@ class ModelTest(unittest.TestCase):
     self.assertTrue(isinstance(qL.distribution, bay.distributions.Normal))
     self.assertTrue(qL.sample(1).shape == (1, test.n_obs, 1))
 
+  def test_scvi_semi_supervised(self):
+    sco = get_dataset(_DS)
+    train, test = sco.split()
+    n_prots = sco.numpy(OMIC.proteomic).shape[1]
+    n_progs = sco.numpy(OMIC.progenitor).shape[1]
+    scvi = SCVI([
+        RandomVariable(sco.n_vars, posterior='zinbd', name=OMIC.transcriptomic),
+        RandomVariable(n_prots, posterior='nbd', name=OMIC.proteomic),
+        RandomVariable(n_progs, posterior='onehot', name=OMIC.progenitor)
+    ])
+    # the projections of the built heads are fused in the decoder
+    self.assertTrue(all(p.built for p in scvi.posteriors[1:]))
+    # the train step is traced into a tf.function
+    scvi.fit(train, epochs=2, compile_graph=True, verbose=False)
+    self.assertTrue(np.all(np.isfinite(scvi.train_history['loss'])))
+
+    (pX, pY, pP), (qZ, qL) = scvi.predict(test, verbose=False)
+    self.assertTrue(pX.batch_shape[1] == test.n_obs)
+    self.assertTrue(pY.event_shape[-1] == n_prots)
+    self.assertTrue(pP.event_shape[-1] == n_progs)
+    self.assertTrue(pY.batch_shape[1] == pP.batch_shape[1] == test.n_obs)
+
 
 if __name__ == '__main__':
   unittest.main()